@@ -12,22 +12,32 @@ resumes — a true human-in-the-loop loop, bounded by `max_clarifications`.
 DB-agnostic: all schema knowledge is discovered at runtime via introspection (_schema_text).
 Structured output: SQL generation uses the LLM's JSON-schema structured-output mode, so the
 decision is guaranteed to be valid JSON matching a fixed schema (no fragile prompt-only JSON).
-Tracing: every node appends a timestamped event to state["trace"] for full observability.
+Tracing: every node appends an event, timed from the run start, to state["trace"] for full
+observability.
+Batching: `run_questions_batch` answers many questions with one SQL-gen call and one answer
+call under a shared prompt, falling back to the single-question graph per item when needed.
 """
 
 from __future__ import annotations
 import os
-import json, sqlite3, time, textwrap, uuid
+import importlib.util
+import asyncio, functools, inspect, json, re, sqlite3, sys, threading, time, textwrap, uuid, weakref
 from dataclasses import dataclass
-from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple, TypedDict
 from langgraph.graph import END, START, StateGraph
 from langgraph.types import Command, interrupt
 from langgraph.checkpoint.memory import MemorySaver
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
 from dotenv import load_dotenv
 
 from schema_retrieval import SchemaIndex
 
+try:
+    import orjson  # optional: faster JSON serialization; stdlib json is the fallback
+except ImportError:
+    orjson = None
+
 load_dotenv()
 
 # ── Types ──────────────────────────────────────────────────────────────────────
@@ -46,9 +56,24 @@ class QAState(TypedDict, total=False):
     clarifications: int         # Number of clarification rounds so far (clarify budget)
     last_error: str             # Most recent error message (empty string = no error)
     columns: List[str]          # Column names returned by the SQL query
-    rows: List[List[Any]]       # Row data returned by the SQL query
+    rows: List[Tuple[Any, ...]] # Row data returned by the SQL query (sqlite3 row tuples)
+    answer_template: str        # LLM-proposed answer with {column} placeholders ("" if none)
     answer: str                 # Final human-readable answer shown to the user
     trace: List[Dict]           # Ordered list of trace events for observability
+    t0_ns: int                  # time.monotonic_ns() at run start; trace events are relative to it
+
+
+class QABatchState(TypedDict, total=False):
+    """
+    State for the batch graph (see build_batch_app).
+    Each entry of `items` carries one labelled question through the pipeline:
+    {"id", "question", "decision", "sql", "answer_template", "columns", "rows", "last_error", "answer"}.
+    """
+    questions: List[str]        # The user questions, in order (labelled q1..qn in prompts)
+    schema: str                 # DB schema text, shared by every question in the batch
+    items: List[Dict[str, Any]] # Per-question results, aligned with `questions`
+    trace: List[Dict]           # Ordered list of trace events for observability
+    t0_ns: int                  # time.monotonic_ns() at run start; trace events are relative to it
 
 
 # ── Structured-output schema ────────────────────────────────────────────────────
@@ -74,34 +99,107 @@ SQL_DECISION_SCHEMA: Dict[str, Any] = {
                 "type": ["string", "null"],
                 "description": "A clarifying question when type=='clarify', otherwise null.",
             },
+            "answer_template": {
+                "type": ["string", "null"],
+                "description": "When type=='sql': a one-sentence answer with {column} placeholders "
+                               "for a single-row result, otherwise null.",
+            },
+        },
+        "required": ["type", "sql", "question", "answer_template"],
+        "additionalProperties": False,
+    },
+}
+
+# Batch variant: one decision per labelled question, aligned by "id" (q1..qn).
+SQL_BATCH_SCHEMA: Dict[str, Any] = {
+    "name": "sql_batch",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "type": {"type": "string", "enum": ["batch"]},
+            "items": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "string", "description": "The question label, e.g. 'q1'."},
+                        **SQL_DECISION_SCHEMA["schema"]["properties"],
+                    },
+                    "required": ["id", *SQL_DECISION_SCHEMA["schema"]["required"]],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["type", "items"],
+        "additionalProperties": False,
+    },
+}
+
+# Batch answers: one grounded answer per labelled question.
+ANSWER_BATCH_SCHEMA: Dict[str, Any] = {
+    "name": "answer_batch",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "items": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "string", "description": "The question label, e.g. 'q1'."},
+                        "answer": {"type": "string"},
+                    },
+                    "required": ["id", "answer"],
+                    "additionalProperties": False,
+                },
+            },
         },
-        "required": ["type", "sql", "question"],
+        "required": ["items"],
         "additionalProperties": False,
     },
 }
 
+# Upper bound on questions per batch call — larger batches start to hurt accuracy.
+BATCH_MAX_QUESTIONS = 16
+
 
 # ── Tracing ────────────────────────────────────────────────────────────────────
 
-def _trace(state: QAState, node: str, **data) -> None:
+def _trace(state: QAState, node: str, *, absolute_ts: bool = False, **data) -> None:
     """
     Append a trace event to state["trace"].
-    Each event records the current timestamp (ms), the node name, and any
-    keyword arguments as structured data — making the full run inspectable.
+    Each event records the milliseconds since the run started (dt_ms, from the monotonic
+    clock and state["t0_ns"]), the node name, and any keyword arguments as structured
+    data — making the full run inspectable. `absolute_ts` also records wall-clock ts_ms.
     """
-    state.setdefault("trace", []).append(
-        {"ts_ms": int(time.time() * 1000), "node": node, "data": data}
-    )
+    now = time.monotonic_ns()
+    event = {"dt_ms": (now - state.setdefault("t0_ns", now)) // 1_000_000, "node": node, "data": data}
+    if absolute_ts:
+        event["ts_ms"] = time.time_ns() // 1_000_000
+    state.setdefault("trace", []).append(event)
 
-def format_trace(trace: List[Dict]) -> str:
+def iter_trace(trace: List[Dict], *, indent: bool = True) -> Iterator[str]:
     """
-    Convert a list of trace events into a human-readable string.
-    Format: [timestamp_ms] node_name  \n  {json payload}
+    Yield each trace event as a human-readable block, one at a time.
+    Format: [+elapsed_ms] node_name  \n  {json payload}  (compact JSON when indent=False);
+    events recorded with a wall-clock timestamp show it too: [+elapsed_ms @ts_ms].
     """
-    return "\n\n".join(
-        f"[{e['ts_ms']}] {e['node']}\n{json.dumps(e['data'], ensure_ascii=False, indent=2)}"
-        for e in trace
-    )
+    for e in trace:
+        ts = f" @{e['ts_ms']}" if "ts_ms" in e else ""
+        yield f"[+{e['dt_ms']}ms{ts}] {e['node']}\n{_dumps(e['data'], indent=indent)}"
+
+def format_trace(trace: List[Dict], *, indent: bool = True) -> str:
+    """Convert a list of trace events into a single human-readable string (see iter_trace)."""
+    return "\n\n".join(iter_trace(trace, indent=indent))
+
+def write_trace(trace: List[Dict], fp: Optional[TextIO] = None, *, indent: bool = True) -> None:
+    """Write the trace to `fp` (default: stdout) block by block, without building one big string."""
+    fp = fp or sys.stdout
+    for i, block in enumerate(iter_trace(trace, indent=indent)):
+        fp.write(f"\n\n{block}" if i else block)
+    fp.write("\n")
 
 
 # ── Config ─────────────────────────────────────────────────────────────────────
@@ -117,54 +215,151 @@ class AgentConfig:
                           stops asking and answers with its best effort
     - schema_top_k:       when schema retrieval (RAG) is enabled, how many tables to retrieve
                           for the question before foreign-key expansion
+    - batch_size:         how many questions run_questions_batch packs into one LLM call
+                          (capped at BATCH_MAX_QUESTIONS)
+    - template_answers:   when the SQL-gen call also returned an answer_template and the query
+                          returns exactly one row, fill the template locally instead of making
+                          a second LLM call for the answer
+    - answer_preview_rows: how many result rows go verbatim into the answer prompt; larger
+                          results are cut to this many plus a row count and per-column
+                          min/max, so the prompt size doesn't grow with the result
+    - trace_verbose:      record the raw LLM output in "llm_raw" trace events and a wall-clock
+                          ts_ms on every event; by default only the output's length and the
+                          time since the run started are kept, so traces stay small
     """
     max_attempts: int = 2
     max_rows: int = 50
     max_clarifications: int = 2
     schema_top_k: int = 3  # when schema-RAG is enabled, how many tables to retrieve
+    batch_size: int = BATCH_MAX_QUESTIONS  # questions per call in run_questions_batch
+    template_answers: bool = True  # render answer_template locally for single-row results
+    answer_preview_rows: int = 10  # rows sent verbatim to the answer LLM; the rest are summarized
+    trace_verbose: bool = False  # keep raw LLM output + wall-clock timestamps in the trace
 
 
 # ── Prompts ────────────────────────────────────────────────────────────────────
+# Templates are dedented once at import; the builders below only fill in the fields.
+# SQL prompts put everything that is the same for every question (instructions, then the
+# schema) first and the question last, so consecutive calls share a byte-identical prefix
+# that the provider's prompt cache can reuse.
 
-def _sql_prompt(question: str, schema: str, last_error: str = "") -> str:
-    """
-    Build the prompt sent to the LLM for SQL generation.
-    - Injects the live DB schema so the LLM only references real tables/columns.
-    - If last_error is set (retry path), appends the error so the LLM can self-correct.
-    - The response *shape* is enforced by SQL_DECISION_SCHEMA (structured output),
-      so the prompt only needs to describe intent, not formatting.
-    """
-    repair = f"\nPrevious SQL failed: {last_error}\nFix it.\n" if last_error else ""
-    return textwrap.dedent(f"""
+_SQL_PREFIX_TMPL = textwrap.dedent("""
 You are a careful data assistant. Convert the user question into a single SQL SELECT query.
 Rules:
 - Use ONLY tables/columns in the schema. Prefer explicit JOINs.
 - If the question is ambiguous, ask for clarification instead of guessing
   (set type="clarify" and put your question in the "question" field).
 - When you can answer, set type="sql" and put the query in the "sql" field.
+- With type="sql", also set "answer_template": a one-sentence answer to the question that
+  uses {{column}} placeholders for the query's result columns, assuming it returns one row
+  (null if a single row would not answer the question).
 Schema:
 {schema}
-User question: {question}{repair}
+""").lstrip()
+
+_SQL_SUFFIX_TMPL = "User question: {question}{repair}"
+
+_ANSWER_TMPL = textwrap.dedent("""
+You are a helpful assistant. Write a concise, human-readable answer grounded ONLY in the SQL result.
+If empty, say so and suggest a likely reason.
+User question: {question}
+SQL: {sql}
+Result: {result}
+""").strip()
+
+_SQL_BATCH_TMPL = textwrap.dedent("""
+You are a careful data assistant. Convert EACH labelled user question into a single SQL SELECT query.
+Rules:
+- Use ONLY tables/columns in the schema. Prefer explicit JOINs.
+- Treat every question independently and return exactly one item per label, with "id" set to it.
+- If a question is ambiguous, ask for clarification instead of guessing
+  (set that item's type="clarify" and put your question in its "question" field).
+- When you can answer, set type="sql" and put the query in the "sql" field.
+- With type="sql", also set "answer_template": a one-sentence answer to the question that
+  uses {{column}} placeholders for the query's result columns, assuming it returns one row
+  (null if a single row would not answer the question).
+Schema:
+{schema}
+User questions:
+{labelled}
+""").strip()
+
+_ANSWER_BATCH_TMPL = textwrap.dedent("""
+You are a helpful assistant. For EACH labelled question, write a concise, human-readable answer
+grounded ONLY in its SQL result. If a result is empty, say so and suggest a likely reason.
+Return exactly one item per label, with "id" set to it.
+{blocks}
 """).strip()
 
-def _answer_prompt(question: str, sql: str, columns: List, rows: List) -> str:
+def _sql_prefix(schema: str) -> str:
+    """The question-independent head of the SQL prompt: instructions followed by the schema."""
+    return _SQL_PREFIX_TMPL.format(schema=schema)
+
+def _sql_prompt(question: str, schema: str, last_error: str = "", *,
+                prefix: Optional[str] = None) -> str:
+    """
+    Build the prompt sent to the LLM for SQL generation.
+    - Injects the live DB schema so the LLM only references real tables/columns.
+    - If last_error is set (retry path), appends the error so the LLM can self-correct.
+    - The response *shape* is enforced by SQL_DECISION_SCHEMA (structured output),
+      so the prompt only needs to describe intent, not formatting.
+    - `prefix` is a precomputed _sql_prefix(schema), reused across questions.
+    """
+    repair = f"\nPrevious SQL failed: {last_error}\nFix it.\n" if last_error else ""
+    head = prefix if prefix is not None else _sql_prefix(schema)
+    return (head + _SQL_SUFFIX_TMPL.format(question=question, repair=repair)).rstrip()
+
+def _answer_prompt(question: str, sql: str, columns: List, rows: List, preview_rows: int = 10) -> str:
     """
     Build the prompt sent to the LLM for answer generation.
-    - Provides the original question, the SQL that was run, and its results.
+    - Provides the original question, the SQL that was run, and its results
+      (at most `preview_rows` rows verbatim — see _summarize_rows).
     - Instructs the LLM to stay grounded in the data (no hallucination).
     - If results are empty, the LLM should say so and suggest a likely reason.
     """
-    return textwrap.dedent(f"""
-You are a helpful assistant. Write a concise, human-readable answer grounded ONLY in the SQL result.
-If empty, say so and suggest a likely reason.
-User question: {question}
-SQL: {sql}
-Result: {json.dumps({"columns": columns, "rows": rows}, ensure_ascii=False)}
-""").strip()
+    return _ANSWER_TMPL.format(question=question, sql=sql,
+                               result=_dumps(_summarize_rows(columns, rows, preview_rows)))
+
+def _sql_prompt_batch(questions: List[str], schema: str) -> str:
+    """
+    Build one SQL-generation prompt for several questions.
+    The instructions and schema are sent once; each question is labelled q1..qn so the
+    structured response (SQL_BATCH_SCHEMA) can be aligned back to its question by id.
+    """
+    labelled = "\n".join(f"q{i}: {q}" for i, q in enumerate(questions, 1))
+    return _SQL_BATCH_TMPL.format(schema=schema, labelled=labelled).rstrip()
+
+def _answer_prompt_batch(items: List[Dict[str, Any]], preview_rows: int = 10) -> str:
+    """
+    Build one answer-generation prompt for several executed questions.
+    Each block keeps its label so the structured response (ANSWER_BATCH_SCHEMA) can be
+    aligned back to its question by id.
+    """
+    blocks = "\n\n".join(
+        f"{it['id']}:\nUser question: {it['question']}\nSQL: {it['sql']}\n"
+        f"Result: {_dumps(_summarize_rows(it['columns'], it['rows'], preview_rows))}"
+        for it in items
+    )
+    return _ANSWER_BATCH_TMPL.format(blocks=blocks)
 
 
 # ── Helpers ────────────────────────────────────────────────────────────────────
 
+def _dumps(obj: Any, *, indent: bool = False, sort_keys: bool = False) -> str:
+    """
+    Serialize to a JSON string — via orjson when installed (compact, UTF-8), else stdlib json.
+    With orjson, non-string dict keys are stringified (as json does) and numpy values
+    (e.g. rows from pandas-backed sources) serialize natively.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=option).decode()
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None, sort_keys=sort_keys)
+
 def _schema_text(conn: sqlite3.Connection) -> str:
     """
     Introspect the SQLite database and return all CREATE TABLE statements as a
@@ -175,22 +370,164 @@ def _schema_text(conn: sqlite3.Connection) -> str:
     cur.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name")
     return "\n\n".join(row[0].strip() + ";" for row in cur.fetchall() if row[0])
 
-def _parse_json(text: str) -> Dict:
+def invalidate_schema(conn: sqlite3.Connection) -> None:
+    """
+    Call after changing the DDL of `conn`: drops the apps run_question and run_questions_batch
+    cached, so their next call re-introspects the schema. Apps you built yourself with
+    build_app keep the schema they were built with — rebuild them as well.
+    """
+    # lru_cache can't evict a single key; the caches are small, so clear them outright.
+    _cached_app.cache_clear()
+    _cached_batch_app.cache_clear()
+
+# Candidate starts of an embedded JSON block; the decoder then consumes exactly one
+# balanced value from there (string-aware, so braces inside strings don't confuse it).
+_JSON_START_RE = re.compile(r"[{\[]")
+_JSON_DECODER = json.JSONDecoder()
+
+def _loads(s: str) -> Any:
+    """Parse a JSON string — via orjson when installed, else stdlib json. Raises ValueError."""
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
+
+def _is_json_obj(obj: Any, batch: bool) -> bool:
+    """True for a JSON object, or — when `batch` — for a non-empty array of objects."""
+    if isinstance(obj, dict):
+        return True
+    return batch and isinstance(obj, list) and bool(obj) and all(isinstance(o, dict) for o in obj)
+
+def _first_json_block(s: str, batch: bool = False) -> Any:
+    """Return the first {...} (or, when `batch`, [{...}, ...]) block in `s`, or None."""
+    for m in _JSON_START_RE.finditer(s):
+        try:
+            obj = _JSON_DECODER.raw_decode(s, m.start())[0]
+        except ValueError:
+            continue
+        if _is_json_obj(obj, batch) and obj:  # skip "[1]", "{}" and the like in prose
+            return obj
+    return None
+
+def _parse_json(text: str, *, batch: bool = False) -> Dict:
     """
     Robustly parse JSON from LLM output.
     With structured outputs the response is already guaranteed valid JSON, so the
-    direct parse path is the norm. The fallback (extract first {...} block) keeps
-    the agent working with LLM backends that don't support structured outputs.
-    Raises if no valid JSON object can be found.
+    direct parse path is the norm. The fallback (extract the first balanced {...}
+    block) keeps the agent working with LLM backends that don't support structured
+    outputs, even when the surrounding prose contains braces or brackets.
+    With `batch=True` a bare array of objects ([A1, ..., An]) is also accepted and
+    normalized to the batch form: {"type": "batch", "items": [...]}.
+    Raises ValueError if no valid JSON object can be found.
     """
     s = text.strip()
     try:
-        return json.loads(s)
+        obj = _loads(s)
+    except ValueError:
+        obj = None
+    if not _is_json_obj(obj, batch):
+        obj = _first_json_block(s, batch)
+        if obj is None:
+            raise ValueError("No JSON object found in LLM output.")
+    if isinstance(obj, list):
+        obj = {"type": "batch", "items": obj}
+    return obj
+
+# A bare {column} placeholder in an answer_template (no format specs or attribute access).
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+def _format_value(value: Any) -> str:
+    """Render a result value for an answer: floats get at most 2 decimals (66.67, not 66.666…)."""
+    if isinstance(value, float):
+        text = f"{value:.2f}".rstrip("0").rstrip(".")
+        return "0" if text == "-0" else text
+    return str(value)
+
+def _render_answer_template(template: Optional[str], columns: List[str], rows: List) -> Optional[str]:
+    """
+    Fill an LLM-proposed answer_template from a single-row result.
+    Returns None — so the caller asks the LLM instead — when there is no template, the
+    result isn't exactly one row, or a placeholder is missing, unknown, or NULL.
+    """
+    if not template or len(rows) != 1:
+        return None
+    values = dict(zip(columns, rows[0]))
+    names = _PLACEHOLDER_RE.findall(template)
+    if not names or any(values.get(n) is None for n in names):
+        return None
+    return _PLACEHOLDER_RE.sub(lambda m: _format_value(values[m.group(1)]), template).strip()
+
+def _close_cursor(cur: Any) -> None:
+    """Close an app's shared cursor; if the connection is already closed, so is the cursor."""
+    try:
+        cur.close()
     except Exception:
-        start, end = s.find("{"), s.rfind("}")
-        if start != -1 and end > start:
-            return json.loads(s[start:end + 1])
-        raise
+        pass
+
+def _plain_rows(conn: Any, rows: List) -> List[Tuple[Any, ...]]:
+    """
+    Rows as plain tuples. sqlite3 already returns tuples (kept as-is — they serialize as JSON
+    arrays); rows from a custom row_factory such as sqlite3.Row are converted, since they
+    don't serialize to JSON or into checkpoints.
+    """
+    if getattr(conn, "row_factory", None) is None:
+        return rows
+    return [tuple(r) for r in rows]
+
+def _summarize_rows(columns: List[str], rows: List, max_rows: int = 10) -> Dict[str, Any]:
+    """
+    The SQL result as shown to the answer LLM: {"columns", "rows"}, unchanged when it has at
+    most `max_rows` rows. Larger results keep the first `max_rows` rows and add the total row
+    count, a truncation marker and min/max of each numeric column, computed over all rows.
+    """
+    if len(rows) <= max_rows:
+        return {"columns": columns, "rows": rows}
+    aggregates: Dict[str, Dict[str, Any]] = {}
+    for i, col in enumerate(columns):
+        values = [r[i] for r in rows if r[i] is not None]
+        if values and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            aggregates[col] = {"min": min(values), "max": max(values)}
+    return {
+        "columns": columns,
+        "rows": rows[:max_rows],
+        "n_total": len(rows),
+        "truncated": f"… {len(rows) - max_rows} more rows truncated",
+        "aggregates": aggregates,
+    }
+
+def _is_async_callable(fn: Any) -> bool:
+    """True for `async def` functions and for objects with an `async def __call__`."""
+    return inspect.iscoroutinefunction(fn) or inspect.iscoroutinefunction(getattr(fn, "__call__", None))
+
+def _on_loop(fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Wrap a sync node as a coroutine so LangGraph runs it on the event loop thread."""
+    async def node(state):
+        return fn(state)
+    return node
+
+def _in_thread(fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Wrap a sync node as a coroutine that runs it in a worker thread."""
+    async def node(state):
+        return await asyncio.to_thread(fn, state)
+    return node
+
+# A query that starts with SELECT, and one that ends in a LIMIT clause (optionally with an
+# OFFSET). Anchoring on the structure means identifiers or literals containing "limit"
+# (limit_reached, 'no limit') don't count, and neither does a LIMIT inside a subquery.
+_SELECT_RE = re.compile(r"^\s*select\b", re.IGNORECASE)
+_LIMIT_RE = re.compile(r"\blimit\s+\d+(?:\s*(?:,|\boffset\b)\s*\d+)?\s*$", re.IGNORECASE)
+
+def _check_sql(sql: str, max_rows: int) -> Tuple[str, str]:
+    """
+    Validate and normalize LLM-generated SQL. Returns (sql, error).
+    - Rejects any non-SELECT query for security (no INSERT/UPDATE/DROP etc.).
+    - Appends LIMIT if the query doesn't end in one, to prevent runaway large result sets.
+    """
+    sql = (sql or "").strip().rstrip(";")
+    if not _SELECT_RE.match(sql):
+        return "", "Only SELECT allowed."
+    if not _LIMIT_RE.search(sql):
+        sql += f" LIMIT {max_rows}"
+    return sql, ""
 
 
 # ── Graph builder ──────────────────────────────────────────────────────────────
@@ -212,19 +549,32 @@ def build_app(*, conn: Any, llm: Callable[..., str], config: Optional[AgentConfi
                           (retry on error)   └──(clarify)──▶ clarify ──(resume)──┐
                                   │                                              │
                                   └────────────────────────────────────── loop back to gen_sql
+        SQL rejected by gen_sql itself (invalid JSON / non-SELECT) retries from gen_sql
+        directly, without the exec_sql hop.
 
     Args:
         conn:            Any DB connection with a .cursor() interface (SQLite used here).
         llm:             Callable (prompt, *, response_schema=None) -> str. Swap to change provider.
+                         An `async def` LLM (see make_openai_llm_async) yields an async graph —
+                         run it with .ainvoke / run_question_async.
         config:          Optional AgentConfig for tuning retry/row/clarify/retrieval limits.
         get_schema_text: Optional full-schema introspection override (used when embed is None).
+                         Called once, when the app is built.
         embed:           Optional embedder Callable[[List[str]], List[List[float]]]; enables schema RAG.
         checkpointer:    LangGraph checkpointer (defaults to in-memory). Required for the
                          human-in-the-loop `interrupt`/resume to work.
     """
     cfg = config or AgentConfig()
+    trace = functools.partial(_trace, absolute_ts=cfg.trace_verbose)
     schema_fn = get_schema_text or _schema_text
     schema_index = SchemaIndex.build(conn, embed) if embed is not None else None
+    # Full-schema mode: the schema doesn't change between questions, so load it — and the
+    # SQL prompt prefix built from it — once here.
+    full_schema = schema_fn(conn) if schema_index is None else ""
+    sql_prefix = _sql_prefix(full_schema) if schema_index is None else None
+    # One cursor for every exec_sql call, closed when the app is garbage-collected; the lock
+    # keeps concurrent runs from interleaving on it. A failed query leaves it reusable.
+    cur, cur_lock = conn.cursor(), threading.Lock()
 
     def load_schema(state: QAState) -> QAState:
         """Node 1 — Make the schema available to the prompt.
@@ -234,11 +584,11 @@ def build_app(*, conn: Any, llm: Callable[..., str], config: Optional[AgentConfi
         """
         if schema_index is not None:
             state["schema"] = schema_index.retrieve(state["question"], embed, top_k=cfg.schema_top_k)
-            _trace(state, "load_schema", chars=len(state["schema"]), mode="retrieval",
+            trace(state, "load_schema", chars=len(state["schema"]), mode="retrieval",
                    top_k=cfg.schema_top_k)
         else:
-            state["schema"] = schema_fn(conn)
-            _trace(state, "load_schema", chars=len(state["schema"]), mode="full")
+            state["schema"] = full_schema
+            trace(state, "load_schema", chars=len(state["schema"]), mode="full")
         return state
 
     def gen_sql(state: QAState) -> QAState:
@@ -250,11 +600,19 @@ def build_app(*, conn: Any, llm: Callable[..., str], config: Optional[AgentConfi
         - Appends LIMIT if the LLM omitted it.
         - Sets state["decision"] = "sql" or "clarify" for downstream routing.
         """
-        raw = llm(
-            _sql_prompt(state["question"], state["schema"], state.get("last_error", "")),
-            response_schema=SQL_DECISION_SCHEMA,
-        )
-        _trace(state, "llm_raw", raw=raw)
+        return apply_sql_decision(state, llm(sql_prompt(state), response_schema=SQL_DECISION_SCHEMA))
+
+    async def agen_sql(state: QAState) -> QAState:
+        """Node 2 for an async LLM — same as gen_sql, awaiting the LLM call."""
+        return apply_sql_decision(state, await llm(sql_prompt(state), response_schema=SQL_DECISION_SCHEMA))
+
+    def sql_prompt(state: QAState) -> str:
+        return _sql_prompt(state["question"], state["schema"], state.get("last_error", ""),
+                           prefix=sql_prefix)
+
+    def apply_sql_decision(state: QAState, raw: str) -> QAState:
+        """Parse and validate the LLM's SQL decision into state (shared by gen_sql/agen_sql)."""
+        trace(state, "llm_raw", raw=raw if cfg.trace_verbose else f"<{len(raw or '')} chars>")
 
         try:
             obj = _parse_json(raw)
@@ -269,17 +627,14 @@ def build_app(*, conn: Any, llm: Callable[..., str], config: Optional[AgentConfi
                          clarification_question=obj.get("question") or "Can you clarify?")
             return state
 
-        sql = (obj.get("sql") or "").strip().rstrip(";")
-        if not sql.lower().startswith("select"):
-            # Reject any non-SELECT query for security (no INSERT/UPDATE/DROP etc.)
-            state.update(decision="sql", sql="", last_error="Only SELECT allowed.")
+        sql, err = _check_sql(obj.get("sql"), cfg.max_rows)
+        if err:
+            state.update(decision="sql", sql="", last_error=err)
             return state
 
-        if " limit " not in sql.lower():
-            sql += f" LIMIT {cfg.max_rows}"  # Prevent runaway large result sets
-
-        state.update(decision="sql", sql=sql, last_error="")
-        _trace(state, "gen_sql", sql=sql)
+        state.update(decision="sql", sql=sql, last_error="",
+                     answer_template=obj.get("answer_template") or "")
+        trace(state, "gen_sql", sql=sql)
         return state
 
     def clarify(state: QAState) -> QAState:
@@ -292,11 +647,10 @@ def build_app(*, conn: Any, llm: Callable[..., str], config: Optional[AgentConfi
         the question and loop back to gen_sql to try again — bounded by max_clarifications.
         """
         reply = interrupt({"clarification_question": state.get("clarification_question", "Can you clarify?")})
-        state["clarifications"] = state.get("clarifications", 0) + 1
-        state["question"] = f'{state["question"]}\n\nAdditional context from user: {reply}'
-        state["decision"] = ""
-        state["clarification_question"] = ""
-        _trace(state, "clarify", reply=reply, n=state["clarifications"])
+        n = state.get("clarifications", 0) + 1
+        state.update(clarifications=n, decision="", clarification_question="",
+                     question=f'{state["question"]}\n\nAdditional context from user: {reply}')
+        trace(state, "clarify", reply=reply, n=n)
         return state
 
     def exec_sql(state: QAState) -> QAState:
@@ -310,41 +664,62 @@ def build_app(*, conn: Any, llm: Callable[..., str], config: Optional[AgentConfi
         if not sql:
             state["last_error"] = state.get("last_error") or "No SQL produced."
             return state
-        cur = conn.cursor()
         try:
-            cur.execute(sql)
-            state["rows"] = [list(r) for r in cur.fetchall()]
-            state["columns"] = [d[0] for d in (cur.description or [])]
-            state["last_error"] = ""
-            _trace(state, "exec_sql", rows=len(state["rows"]))
+            with cur_lock:
+                cur.execute(sql)
+                rows = _plain_rows(conn, cur.fetchall())
+                columns = [d[0] for d in (cur.description or [])]
+            state.update(rows=rows, columns=columns, last_error="")
+            trace(state, "exec_sql", rows=len(rows))
         except Exception as e:
             state.update(columns=[], rows=[], last_error=str(e))
-            _trace(state, "exec_sql_error", error=str(e))
-        finally:
-            cur.close()
+            trace(state, "exec_sql_error", error=str(e))
         return state
 
     def answer(state: QAState) -> QAState:
         """
         Node 4 (terminal) — Produce the final answer shown to the user.
-        Three cases:
+        Four cases:
           1. decision == "clarify" (clarify budget exhausted): return the pending question.
           2. last_error is set (retries exhausted): return a debug-friendly error message.
-          3. Normal path: ask the LLM to summarize the SQL results in plain English.
+          3. Single-row result and gen_sql proposed an answer_template: fill it in locally,
+             saving the second LLM round-trip (see AgentConfig.template_answers).
+          4. Otherwise: ask the LLM to summarize the SQL results in plain English.
         """
-        if state.get("decision") == "clarify":
-            state["answer"] = state.get("clarification_question", "Can you clarify?")
-        elif state.get("last_error"):
-            state["answer"] = (f"Couldn't run a valid SQL query.\nError: {state['last_error']}\n"
-                               "Try rephrasing or adding missing details.")
-        else:
-            state["answer"] = llm(_answer_prompt(
-                state["question"], state["sql"],
-                state.get("columns", []), state.get("rows", [])
-            )).strip()
-        _trace(state, "answer", answer=state["answer"])
+        text, mode = local_answer(state)
+        if text is None:
+            text, mode = llm(answer_prompt(state)).strip(), "llm"
+        state["answer"] = text
+        trace(state, "answer", answer=text, mode=mode)
+        return state
+
+    async def aanswer(state: QAState) -> QAState:
+        """Node 4 for an async LLM — same as answer, awaiting the LLM call."""
+        text, mode = local_answer(state)
+        if text is None:
+            text, mode = (await llm(answer_prompt(state))).strip(), "llm"
+        state["answer"] = text
+        trace(state, "answer", answer=text, mode=mode)
         return state
 
+    def local_answer(state: QAState) -> Tuple[Optional[str], str]:
+        """(answer, mode) for cases 1–3 of the answer node, or (None, "") when the LLM should answer."""
+        if state.get("decision") == "clarify":
+            return state.get("clarification_question", "Can you clarify?"), "clarify"
+        if state.get("last_error"):
+            return (f"Couldn't run a valid SQL query.\nError: {state['last_error']}\n"
+                    "Try rephrasing or adding missing details."), "error"
+        if cfg.template_answers:
+            text = _render_answer_template(state.get("answer_template"),
+                                           state.get("columns", []), state.get("rows", []))
+            if text is not None:
+                return text, "template"
+        return None, ""
+
+    def answer_prompt(state: QAState) -> str:
+        return _answer_prompt(state["question"], state["sql"], state.get("columns", []),
+                              state.get("rows", []), cfg.answer_preview_rows)
+
     def inc_attempts(state: QAState) -> QAState:
         """
         Node 5 — Increment the SQL-attempt counter before each generation call on the
@@ -352,7 +727,7 @@ def build_app(*, conn: Any, llm: Callable[..., str], config: Optional[AgentConfi
         the SQL retry budget.
         """
         state["attempts"] = state.get("attempts", 0) + 1
-        _trace(state, "attempt", n=state["attempts"])
+        trace(state, "attempt", n=state["attempts"])
         return state
 
     def route_after_gen(state: QAState) -> str:
@@ -360,12 +735,16 @@ def build_app(*, conn: Any, llm: Callable[..., str], config: Optional[AgentConfi
         Conditional edge after gen_sql.
         - "clarify"  → pause for the user (while clarify budget remains)
         - "answer"   → clarify budget exhausted; answer with the pending question
+        - "attempt"  → the SQL was rejected before execution (invalid JSON / non-SELECT):
+                       retry straight away instead of passing through exec_sql
         - "exec_sql" → run the generated SQL
         """
         if state.get("decision") == "clarify":
             if state.get("clarifications", 0) < cfg.max_clarifications:
                 return "clarify"
             return "answer"
+        if not state.get("sql") and state.get("last_error"):
+            return "attempt" if state.get("attempts", 0) < cfg.max_attempts else "answer"
         return "exec_sql"
 
     def should_retry(state: QAState) -> str:
@@ -380,33 +759,204 @@ def build_app(*, conn: Any, llm: Callable[..., str], config: Optional[AgentConfi
                 return "retry"
         return "no_retry"
 
+    nodes = [("load_schema", load_schema), ("attempt", inc_attempts),
+             ("gen_sql", gen_sql), ("clarify", clarify),
+             ("exec_sql", exec_sql), ("answer", answer)]
+    if _is_async_callable(llm):
+        # Async LLM → async graph (run with .ainvoke). LangGraph runs plain functions in a
+        # worker thread under .ainvoke, but a sqlite3 connection is bound to the thread that
+        # created it, so the remaining nodes run on the event loop thread instead. Only
+        # load_schema (no DB access; may block on the embedder) is pushed to a thread.
+        async_nodes = {"gen_sql": agen_sql, "answer": aanswer,
+                       "load_schema": _in_thread(load_schema)}
+        nodes = [(name, async_nodes.get(name) or _on_loop(fn)) for name, fn in nodes]
+
     # Wire up the graph nodes and edges
     g = StateGraph(QAState)
-    for name, fn in [("load_schema", load_schema), ("attempt", inc_attempts),
-                     ("gen_sql", gen_sql), ("clarify", clarify),
-                     ("exec_sql", exec_sql), ("answer", answer)]:
+    for name, fn in nodes:
         g.add_node(name, fn)
 
     g.add_edge(START, "load_schema")
     g.add_edge("load_schema", "attempt")
     g.add_edge("attempt", "gen_sql")
     g.add_conditional_edges("gen_sql", route_after_gen,
-                            {"clarify": "clarify", "exec_sql": "exec_sql", "answer": "answer"})
+                            {"clarify": "clarify", "exec_sql": "exec_sql", "answer": "answer",
+                             "attempt": "attempt"})
     g.add_edge("clarify", "gen_sql")
     g.add_conditional_edges("exec_sql", should_retry, {"retry": "attempt", "no_retry": "answer"})
     g.add_edge("answer", END)
-    return g.compile(checkpointer=checkpointer or MemorySaver())
+    app = g.compile(checkpointer=checkpointer or MemorySaver())
+    weakref.finalize(app, _close_cursor, cur)
+    return app
+
+
+def build_batch_app(*, conn: Any, llm: Callable[..., str], config: Optional[AgentConfig] = None,
+                    get_schema_text: Optional[Callable[[Any], str]] = None):
+    """
+    Compile and return a LangGraph runnable that answers several questions at once.
+
+    The schema and instructions are sent once for the whole batch instead of once per
+    question, and the per-question SQL results are answered in a single call:
+
+        START → load_schema → gen_sql_batch (1 LLM call) → exec_sql (per item) → answer_batch (1 LLM call) → END
+
+    Questions are labelled q1..qn in both prompts and aligned back by id. There is no retry
+    or clarify loop here: items that end up without an answer (clarify, invalid SQL, DB
+    error, missing from the response) are left for the caller to rerun through build_app.
+
+    The batch graph is synchronous: passing an async LLM (see make_openai_llm_async)
+    raises TypeError — use run_questions_async for those.
+    """
+    if _is_async_callable(llm):
+        raise TypeError("build_batch_app needs a sync LLM; for an async LLM use run_questions_async.")
+    cfg = config or AgentConfig()
+    trace = functools.partial(_trace, absolute_ts=cfg.trace_verbose)
+    full_schema = (get_schema_text or _schema_text)(conn)
+    cur, cur_lock = conn.cursor(), threading.Lock()  # shared by every exec_sql call, as in build_app
+
+    def load_schema(state: QABatchState) -> QABatchState:
+        """Node 1 — Make the full schema (loaded once at build time) available to the prompt."""
+        state["schema"] = full_schema
+        trace(state, "load_schema", chars=len(state["schema"]), mode="full")
+        return state
+
+    def gen_sql_batch(state: QABatchState) -> QABatchState:
+        """
+        Node 2 — One LLM call generates SQL (or a clarification request) for every question.
+        Each returned item is validated like gen_sql in build_app; items the model skipped
+        or returned unparseable output for are marked with last_error.
+        """
+        questions = state["questions"]
+        items = [{"id": f"q{i}", "question": q, "decision": "", "sql": "", "last_error": ""}
+                 for i, q in enumerate(questions, 1)]
+        raw = llm(_sql_prompt_batch(questions, state["schema"]), response_schema=SQL_BATCH_SCHEMA)
+        trace(state, "llm_raw", raw=raw if cfg.trace_verbose else f"<{len(raw or '')} chars>")
+
+        try:
+            by_id = {o.get("id"): o for o in _parse_json(raw, batch=True).get("items", [])
+                     if isinstance(o, dict)}
+        except Exception as e:
+            by_id = {}
+            trace(state, "gen_sql_batch_error", error=f"Invalid JSON: {e}")
+
+        for it in items:
+            obj = by_id.get(it["id"])
+            if obj is None:
+                it.update(decision="sql", last_error="Missing from batch response.")
+            elif obj.get("type") == "clarify":
+                it.update(decision="clarify",
+                          clarification_question=obj.get("question") or "Can you clarify?")
+            else:
+                sql, err = _check_sql(obj.get("sql"), cfg.max_rows)
+                it.update(decision="sql", sql=sql, last_error=err,
+                          answer_template=obj.get("answer_template") or "")
+        state["items"] = items
+        trace(state, "gen_sql_batch", sql={it["id"]: it["sql"] for it in items if it["sql"]})
+        return state
+
+    def exec_sql(state: QABatchState) -> QABatchState:
+        """Node 3 — Execute each item's SQL on the shared connection, recording rows or the error."""
+        for it in state["items"]:
+            if not it["sql"]:
+                continue
+            try:
+                with cur_lock:
+                    cur.execute(it["sql"])
+                    it.update(rows=_plain_rows(conn, cur.fetchall()),
+                              columns=[d[0] for d in (cur.description or [])], last_error="")
+            except Exception as e:
+                it.update(columns=[], rows=[], last_error=str(e))
+        trace(state, "exec_sql", rows={it["id"]: len(it["rows"]) for it in state["items"] if "rows" in it},
+               errors={it["id"]: it["last_error"] for it in state["items"] if it["last_error"]})
+        return state
+
+    def answer_batch(state: QABatchState) -> QABatchState:
+        """
+        Node 4 (terminal) — One LLM call answers every item whose SQL ran successfully.
+        Single-row items with an answer_template are filled in locally first (as in build_app);
+        items the batch response leaves unanswered are answered one by one with _answer_prompt.
+        """
+        ready = [it for it in state["items"] if it["sql"] and not it["last_error"]]
+        if cfg.template_answers:
+            for it in ready:
+                text = _render_answer_template(it.get("answer_template"), it["columns"], it["rows"])
+                if text is not None:
+                    it["answer"] = text
+        templated = [it["id"] for it in ready if "answer" in it]
+        ready = [it for it in ready if "answer" not in it]
+        if ready:
+            raw = llm(_answer_prompt_batch(ready, cfg.answer_preview_rows),
+                      response_schema=ANSWER_BATCH_SCHEMA)
+            try:
+                answers = {o.get("id"): o.get("answer")
+                           for o in _parse_json(raw, batch=True).get("items", []) if isinstance(o, dict)}
+            except Exception:
+                answers = {}
+            for it in ready:
+                it["answer"] = (answers.get(it["id"]) or llm(_answer_prompt(
+                    it["question"], it["sql"], it["columns"], it["rows"], cfg.answer_preview_rows
+                ))).strip()
+        trace(state, "answer_batch", answered=[it["id"] for it in ready], templated=templated)
+        return state
+
+    g = StateGraph(QABatchState)
+    for name, fn in [("load_schema", load_schema), ("gen_sql_batch", gen_sql_batch),
+                     ("exec_sql", exec_sql), ("answer_batch", answer_batch)]:
+        g.add_node(name, fn)
+
+    g.add_edge(START, "load_schema")
+    g.add_edge("load_schema", "gen_sql_batch")
+    g.add_edge("gen_sql_batch", "exec_sql")
+    g.add_edge("exec_sql", "answer_batch")
+    g.add_edge("answer_batch", END)
+    app = g.compile()
+    weakref.finalize(app, _close_cursor, cur)
+    return app
 
 
 # ── Public API ─────────────────────────────────────────────────────────────────
 
+@functools.lru_cache(maxsize=8)
+def _cached_app(conn, llm, config: Optional[AgentConfig], embed):
+    """build_app memoized on (conn, llm, config, embed), so repeated run_question calls reuse one graph."""
+    return build_app(conn=conn, llm=llm, config=config, get_schema_text=_schema_text, embed=embed)
+
+@functools.lru_cache(maxsize=8)
+def _cached_batch_app(conn, llm, config: Optional[AgentConfig]):
+    """build_batch_app memoized on (conn, llm, config), like _cached_app for run_question."""
+    return build_batch_app(conn=conn, llm=llm, config=config)
+
+def _hashable(*args: Any) -> bool:
+    try:
+        hash(args)
+    except TypeError:
+        return False
+    return True
+
+def _app_for(conn, llm, config: Optional[AgentConfig], embed):
+    """The cached app for these arguments; an uncached one when the llm or embed can't be hashed."""
+    if _hashable(conn, llm, config, embed):
+        return _cached_app(conn, llm, config, embed)
+    return build_app(conn=conn, llm=llm, config=config, get_schema_text=_schema_text, embed=embed)
+
+def _batch_app_for(conn, llm, config: Optional[AgentConfig]):
+    """Like _app_for, for the batch graph."""
+    if _hashable(conn, llm, config):
+        return _cached_batch_app(conn, llm, config)
+    return build_batch_app(conn=conn, llm=llm, config=config)
+
 def run_question(*, conn, llm, question: str,
                  config: Optional[AgentConfig] = None,
                  on_clarify: Optional[Callable[[str], str]] = None,
                  embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
-                 thread_id: Optional[str] = None) -> Tuple[str, List, QAState]:
+                 thread_id: Optional[str] = None,
+                 app: Optional[Any] = None) -> Tuple[str, List, QAState]:
     """
-    Convenience wrapper: build the app, run one question, return results.
+    Convenience wrapper: run one question, return results.
+
+    The compiled graph is reused across calls: pass a prebuilt `app` (from build_app), or
+    let run_question build one and cache it per (conn, llm, config, embed) — when the llm
+    and embed are hashable; otherwise the app is built for this call only.
 
     Schema RAG:
         Pass `embed` to enable schema retrieval (only relevant tables go into the prompt).
@@ -423,55 +973,262 @@ def run_question(*, conn, llm, question: str,
         trace  (List[Dict])   — full execution trace for debugging
         state  (QAState)      — complete final state (includes SQL, rows, etc.)
     """
-    app = build_app(conn=conn, llm=llm, config=config, get_schema_text=_schema_text, embed=embed)
-    run_config = {"configurable": {"thread_id": thread_id or str(uuid.uuid4())}}
-    state: QAState = {"question": question, "trace": [], "attempts": 0, "clarifications": 0}
-
-    out = app.invoke(state, config=run_config)
+    # The internally built app is shared process-wide and run_with_app finishes the clarify
+    # loop itself, so none of its checkpoints are needed once the call returns.
+    keep_thread = app is not None and thread_id is not None
+    if app is None:
+        app = _app_for(conn, llm, config, embed)
+    return run_with_app(app, question, on_clarify=on_clarify, thread_id=thread_id,
+                        keep_thread=keep_thread)
+
+def _initial_state(question: str) -> QAState:
+    """
+    Fresh input state for one run. Every per-run field is set, so a reused thread_id doesn't
+    carry the previous run's SQL, error or rows over from its checkpoint.
+    """
+    return {"question": question, "schema": "", "decision": "", "clarification_question": "",
+            "sql": "", "attempts": 0, "clarifications": 0, "last_error": "", "columns": [],
+            "rows": [], "answer_template": "", "answer": "", "trace": [],
+            "t0_ns": time.monotonic_ns()}
 
-    # Drive the human-in-the-loop clarification loop, if the graph paused.
-    while "__interrupt__" in out:
-        intr = out["__interrupt__"][0]
-        payload = getattr(intr, "value", intr)
-        clar_q = payload.get("clarification_question", "Can you clarify?") \
-            if isinstance(payload, dict) else str(payload)
+def run_with_app(app, question: str, *,
+                 on_clarify: Optional[Callable[[str], str]] = None,
+                 thread_id: Optional[str] = None,
+                 keep_thread: Optional[bool] = None) -> Tuple[str, List, QAState]:
+    """
+    Run one question on an already-compiled app (see build_app) and return
+    (answer, trace, state) — same contract as run_question.
 
-        if on_clarify is None:
-            # Non-interactive: surface the question instead of blocking.
-            return clar_q, out.get("trace", []), out
+    Build the app once and call this per question to avoid recompiling the graph.
+    The thread's checkpoints are dropped once the call returns unless `keep_thread` is true
+    (default: only when you passed a `thread_id`) — so a long-lived app doesn't accumulate
+    checkpoints, and their stored rows, for runs nobody will resume.
+    """
+    thread = thread_id or str(uuid.uuid4())
+    if keep_thread is None:
+        keep_thread = thread_id is not None
+    run_config = {"configurable": {"thread_id": thread}}
+    state = _initial_state(question)
 
-        reply = on_clarify(clar_q)
-        out = app.invoke(Command(resume=reply), config=run_config)
+    try:
+        out = app.invoke(state, config=run_config)
+
+        # Drive the human-in-the-loop clarification loop, if the graph paused.
+        while "__interrupt__" in out:
+            intr = out["__interrupt__"][0]
+            payload = getattr(intr, "value", intr)
+            clar_q = payload.get("clarification_question", "Can you clarify?") \
+                if isinstance(payload, dict) else str(payload)
+
+            if on_clarify is None:
+                # Non-interactive: surface the question instead of blocking.
+                return clar_q, out.get("trace", []), out
+
+            reply = on_clarify(clar_q)
+            out = app.invoke(Command(resume=reply), config=run_config)
+
+        return out.get("answer", ""), out.get("trace", []), out
+    finally:
+        delete_thread = getattr(app.checkpointer, "delete_thread", None)
+        if not keep_thread and delete_thread is not None:
+            delete_thread(thread)
+
+async def run_question_async(*, conn, llm, question: str,
+                             config: Optional[AgentConfig] = None,
+                             on_clarify: Optional[Callable[[str], Any]] = None,
+                             embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                             thread_id: Optional[str] = None,
+                             app: Optional[Any] = None) -> Tuple[str, List, QAState]:
+    """
+    Async counterpart of run_question, for an async LLM (see make_openai_llm_async).
+    Await it directly, or run several questions concurrently with run_questions_async.
+    `on_clarify` may be a plain function or a coroutine function.
+    """
+    keep_thread = app is not None and thread_id is not None  # see run_question
+    if app is None:
+        app = _app_for(conn, llm, config, embed)
+    return await run_with_app_async(app, question, on_clarify=on_clarify, thread_id=thread_id,
+                                    keep_thread=keep_thread)
+
+async def run_with_app_async(app, question: str, *,
+                             on_clarify: Optional[Callable[[str], Any]] = None,
+                             thread_id: Optional[str] = None,
+                             keep_thread: Optional[bool] = None) -> Tuple[str, List, QAState]:
+    """Async counterpart of run_with_app: run one question on an app built with an async LLM."""
+    thread = thread_id or str(uuid.uuid4())
+    if keep_thread is None:
+        keep_thread = thread_id is not None
+    run_config = {"configurable": {"thread_id": thread}}
+    state = _initial_state(question)
 
-    return out.get("answer", ""), out.get("trace", []), out
+    try:
+        out = await app.ainvoke(state, config=run_config)
+
+        # Drive the human-in-the-loop clarification loop, if the graph paused.
+        while "__interrupt__" in out:
+            intr = out["__interrupt__"][0]
+            payload = getattr(intr, "value", intr)
+            clar_q = payload.get("clarification_question", "Can you clarify?") \
+                if isinstance(payload, dict) else str(payload)
+
+            if on_clarify is None:
+                # Non-interactive: surface the question instead of blocking.
+                return clar_q, out.get("trace", []), out
+
+            reply = on_clarify(clar_q)
+            if inspect.isawaitable(reply):
+                reply = await reply
+            out = await app.ainvoke(Command(resume=reply), config=run_config)
+
+        return out.get("answer", ""), out.get("trace", []), out
+    finally:
+        delete_thread = getattr(app.checkpointer, "adelete_thread", None)
+        if not keep_thread and delete_thread is not None:
+            await delete_thread(thread)
+
+async def run_questions_async(*, conn, llm, questions: List[str],
+                              config: Optional[AgentConfig] = None,
+                              on_clarify: Optional[Callable[[str], Any]] = None,
+                              embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                              app: Optional[Any] = None) -> List[Tuple[str, List, QAState]]:
+    """
+    Run independent questions concurrently on one async app (asyncio.gather), so N questions
+    take roughly one question's LLM round-trips instead of N. SQL execution stays synchronous
+    on the event loop thread. Returns one (answer, trace, state) tuple per question, in order.
+    """
+    if app is None:
+        app = _app_for(conn, llm, config, embed)
+    return list(await asyncio.gather(*(
+        run_with_app_async(app, q, on_clarify=on_clarify) for q in questions
+    )))
+
+def run_questions_batch(*, conn, llm, questions: List[str],
+                        config: Optional[AgentConfig] = None,
+                        on_clarify: Optional[Callable[[str], str]] = None,
+                        embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                        app: Optional[Any] = None) -> List[Tuple[str, List, QAState]]:
+    """
+    Answer many questions with shared prompts: per chunk of `config.batch_size` questions,
+    one SQL-generation call and one answer call (see build_batch_app) instead of two calls
+    per question, so the schema and instructions are sent once per chunk. The batch graph
+    is compiled once and reused per (conn, llm, config).
+
+    Any question the batch could not answer — a clarification request, invalid SQL, a DB
+    error, or an unparseable batch response — falls back to run_question, which keeps the
+    retry loop, human-in-the-loop clarification (`on_clarify`) and schema RAG (`embed`).
+    Pass a prebuilt single-question `app` (from build_app) to use it for the fallback.
+
+    Returns one (answer, trace, state) tuple per question, in input order. Batched items
+    share the batch trace. Raises TypeError for an async LLM (see build_batch_app).
+    """
+    cfg = config or AgentConfig()
+    size = max(1, min(cfg.batch_size, BATCH_MAX_QUESTIONS))
+    batch_app = _batch_app_for(conn, llm, config)
+    results: List[Tuple[str, List, QAState]] = []
+
+    for i in range(0, len(questions), size):
+        out = batch_app.invoke({"questions": questions[i:i + size], "trace": [],
+                                "t0_ns": time.monotonic_ns()})
+        for it in out.get("items", []):
+            if it.get("answer"):
+                state: QAState = {
+                    "question": it["question"], "schema": out["schema"], "decision": "sql",
+                    "sql": it["sql"], "answer_template": it["answer_template"],
+                    "attempts": 1, "clarifications": 0, "last_error": "",
+                    "columns": it["columns"], "rows": it["rows"], "answer": it["answer"],
+                    "trace": out["trace"],
+                }
+                results.append((it["answer"], out["trace"], state))
+            else:
+                results.append(run_question(conn=conn, llm=llm, question=it["question"],
+                                            config=config, on_clarify=on_clarify, embed=embed,
+                                            app=app))
+    return results
 
 def load_sql_file(sql_path: str, *, sqlite_path: str = ":memory:") -> sqlite3.Connection:
     """
     Load a .sql file into a SQLite database and return the connection.
     Defaults to an in-memory DB (":memory:") — pass a file path for persistence.
-    Foreign key enforcement is enabled automatically.
+    Foreign key enforcement is enabled automatically. The connection keeps up to 256
+    prepared statements cached (so repeated queries skip re-parsing), and file-backed
+    databases use WAL journaling so readers don't block on a writer.
     """
-    conn = sqlite3.connect(sqlite_path)
+    conn = sqlite3.connect(sqlite_path, cached_statements=256)
     conn.execute("PRAGMA foreign_keys = ON;")
+    conn.execute("PRAGMA journal_mode = WAL;")  # no-op ("memory") for in-memory databases
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute("PRAGMA temp_store = MEMORY;")
     with open(sql_path, encoding="utf-8") as f:
         conn.executescript(f.read())
     return conn
 
-def make_openai_llm(model: str = "gpt-4o-mini") -> Callable[..., str]:
+# HTTP transport for the OpenAI clients: a keep-alive pool large enough for concurrent
+# questions, and HTTP/2 (one multiplexed connection, fewer TLS handshakes) when the optional
+# `h2` package is installed (pip install "httpx[http2]").
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=64)
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+def _openai_client_kwargs(*, use_async: bool = False) -> Dict[str, Any]:
+    """Constructor kwargs for OpenAI / AsyncOpenAI: pooled HTTP client + OPENAI_MAX_RETRIES."""
+    http_client_cls = DefaultAsyncHttpxClient if use_async else DefaultHttpxClient
+    return {
+        "http_client": http_client_cls(http2=_HTTP2, limits=_HTTP_LIMITS, timeout=30.0),
+        "max_retries": int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+    }
+
+def make_openai_llm(model: str = "gpt-4o-mini", *, cache_size: int = 256) -> Callable[..., str]:
     """
     Returns a Callable (prompt, *, response_schema=None) -> str backed by OpenAI.
-    Reads OPENAI_API_KEY from .env via load_dotenv().
+    Reads OPENAI_API_KEY (and optionally OPENAI_MAX_RETRIES) from .env via load_dotenv().
     temperature=0 → deterministic SQL generation (no creativity, just accuracy).
 
     When `response_schema` is provided, OpenAI Structured Outputs are used, guaranteeing
     the returned content is valid JSON conforming to that schema.
+
+    Responses are memoized per (prompt, response_schema) in an LRU of `cache_size` entries
+    (0 disables it): with temperature=0 an identical prompt gets the cached answer instead of
+    another API call. `llm.cache_clear()` / `llm.cache_info()` manage the cache.
     """
-    client = OpenAI()
+    client = OpenAI(**_openai_client_kwargs())
+    schemas: Dict[str, Dict[str, Any]] = {}  # cache key → response_schema
+
+    @functools.lru_cache(maxsize=cache_size)
+    def complete(prompt: str, schema_key: Optional[str]) -> str:
+        kwargs: Dict[str, Any] = {}
+        if schema_key is not None:
+            kwargs["response_format"] = {"type": "json_schema", "json_schema": schemas[schema_key]}
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            **kwargs,
+        )
+        return response.choices[0].message.content
+
     def llm(prompt: str, *, response_schema: Optional[Dict[str, Any]] = None) -> str:
+        schema_key = None
+        if response_schema is not None:
+            schema_key = _dumps(response_schema, sort_keys=True)
+            schemas.setdefault(schema_key, response_schema)
+        return complete(prompt, schema_key)
+
+    llm.cache_clear = complete.cache_clear
+    llm.cache_info = complete.cache_info
+    return llm
+
+
+def make_openai_llm_async(model: str = "gpt-4o-mini") -> Callable[..., Any]:
+    """
+    Async variant of make_openai_llm, backed by AsyncOpenAI: returns an
+    `async def llm(prompt, *, response_schema=None) -> str`. Passing it to build_app /
+    run_question_async / run_questions_async lets many questions run concurrently.
+    """
+    client = AsyncOpenAI(**_openai_client_kwargs(use_async=True))
+    async def llm(prompt: str, *, response_schema: Optional[Dict[str, Any]] = None) -> str:
         kwargs: Dict[str, Any] = {}
         if response_schema is not None:
             kwargs["response_format"] = {"type": "json_schema", "json_schema": response_schema}
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=model,
             messages=[{"role": "user", "content": prompt}],
             temperature=0,
@@ -486,7 +1243,7 @@ def make_openai_embedder(model: str = "text-embedding-3-small") -> Callable[[Lis
     Returns an embedder Callable[[List[str]], List[List[float]]] backed by OpenAI.
     Pass it to build_app/run_question to enable schema retrieval (RAG over the schema).
     """
-    client = OpenAI()
+    client = OpenAI(**_openai_client_kwargs())
     def embed(texts: List[str]) -> List[List[float]]:
         resp = client.embeddings.create(model=model, input=texts)
         return [d.embedding for d in resp.data]
@@ -499,7 +1256,7 @@ if __name__ == "__main__":
                      "ecommerce_schema_and_seed.sql")
     )
 
-    llm = make_openai_llm(model="gpt-4o-mini")
+    llm = make_openai_llm_async(model="gpt-4o-mini")
     embed = make_openai_embedder()  # enables schema RAG (retrieve relevant tables per question)
 
     questions = [
@@ -511,11 +1268,23 @@ if __name__ == "__main__":
         "List customers from Israel and how much each has spent.",
     ]
 
-    for q in questions:
+    async def main():
+        # All questions run concurrently on one compiled app, non-interactively. Questions that
+        # need clarification are then rerun one at a time, prompting via input() — so each
+        # prompt follows its question and never blocks the event loop under the others.
+        app = build_app(conn=conn, llm=llm, embed=embed)
+        results = await run_questions_async(conn=conn, llm=llm, questions=questions, app=app)
+        for i, (q, (_, _, out)) in enumerate(zip(questions, results)):
+            if "__interrupt__" in out:
+                print(f"\nQ: {q}")
+                results[i] = await run_question_async(conn=conn, llm=llm, question=q, app=app,
+                                                      on_clarify=input)
+        return results
+
+    results = asyncio.run(main())
+    for q, (ans, trace, _) in zip(questions, results):
         print(f"\n{'='*60}")
         print(f"Q: {q}")
-        # In the CLI, answer clarification prompts interactively via input().
-        ans, trace, _ = run_question(conn=conn, llm=llm, question=q, on_clarify=input, embed=embed)
         print(f"A: {ans}")
         print("\n--- TRACE ---")
-        print(format_trace(trace))
+        write_trace(trace)
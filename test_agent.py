@@ -5,17 +5,26 @@ Covers:
   2. SQL generation from natural language (incl. structured-output schema)
   3. End-to-end agent behavior
   4. Human-in-the-loop clarification (interrupt + resume)
+  5. Schema RAG (retrieval over the schema)
+  6. Batched questions (shared prompt, per-item fallback)
+  7. Async / concurrent questions
 
 Run with: pytest test_agent.py -v
 """
 
+import gc
+import io
 import os
 import json
+import asyncio
 import sqlite3
 import pytest
 from qa_agent import (
-    AgentConfig, SQL_DECISION_SCHEMA, _parse_json, _schema_text, _sql_prompt,
-    build_app, run_question,
+    AgentConfig, ANSWER_BATCH_SCHEMA, SQL_BATCH_SCHEMA, SQL_DECISION_SCHEMA, _answer_prompt,
+    _cached_app, _cached_batch_app, _check_sql, _dumps, _openai_client_kwargs, _parse_json,
+    _render_answer_template, _schema_text, _sql_prompt, _sql_prompt_batch, build_app, format_trace,
+    invalidate_schema, load_sql_file, make_openai_llm, run_question, run_questions_async,
+    run_questions_batch, run_with_app, write_trace,
 )
 
 # A reusable run config — build_app compiles with a checkpointer, so direct
@@ -34,11 +43,11 @@ def conn():
     yield db
     db.close()
 
-def sql_resp(sql):
-    return json.dumps({"type": "sql", "sql": sql, "question": None})
+def sql_resp(sql, template=None):
+    return _dumps({"type": "sql", "sql": sql, "question": None, "answer_template": template})
 
 def clarify_resp(q):
-    return json.dumps({"type": "clarify", "sql": None, "question": q})
+    return _dumps({"type": "clarify", "sql": None, "question": q, "answer_template": None})
 
 class FakeLLM:
     """Test double. Returns queued JSON for SQL-gen calls, a fixed string otherwise."""
@@ -47,12 +56,14 @@ class FakeLLM:
         self._answer = answer
         self.sql_calls = []
         self.schemas = []  # records the response_schema passed on each SQL-gen call
+        self.answer_calls = []
 
     def __call__(self, prompt, *, response_schema=None):
         if "Convert the user question" in prompt:
             self.sql_calls.append(prompt)
             self.schemas.append(response_schema)
             return self._queue.pop(0) if len(self._queue) > 1 else self._queue[0]
+        self.answer_calls.append(prompt)
         return self._answer
 
 
@@ -95,6 +106,15 @@ def test_unique_order_item_constraint(conn):
         conn.commit()
 
 
+def test_load_sql_file_uses_wal_for_file_db(tmp_path):
+    sql_path = os.path.join(os.path.dirname(__file__), "ecommerce_schema_and_seed.sql")
+    db = load_sql_file(sql_path, sqlite_path=str(tmp_path / "shop.db"))
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    assert db.execute("SELECT COUNT(*) FROM customers").fetchone()[0] > 0
+    db.close()
+
+
 # ── 2. SQL generation from natural language ────────────────────────────────────
 
 def test_parse_json_clean():
@@ -105,6 +125,23 @@ def test_parse_json_with_extra_text():
     obj = _parse_json('Sure! {"type":"clarify","question":"Which category?"} done.')
     assert obj["type"] == "clarify"
 
+def test_parse_json_ignores_braces_in_trailing_prose():
+    obj = _parse_json('{"type":"sql","sql":"SELECT 1"} Note: {x} is a placeholder.')
+    assert obj == {"type": "sql", "sql": "SELECT 1"}
+
+def test_parse_json_skips_non_object_blocks_in_leading_prose():
+    """Brackets or an empty {} before the real object must not be mistaken for it."""
+    want = {"type": "sql", "sql": "SELECT 1"}
+    assert _parse_json('Step [1]: here is the JSON {"type":"sql","sql":"SELECT 1"}') == want
+    assert _parse_json('Here you go: {} {"type":"sql","sql":"SELECT 1"}') == want
+
+def test_parse_json_array_is_batch():
+    """A bare [A1, ..., An] response is normalized to the batch form — only when asked for."""
+    raw = '[{"id":"q1","type":"sql","sql":"SELECT 1","question":null}]'
+    obj = _parse_json(raw, batch=True)
+    assert obj["type"] == "batch" and obj["items"][0]["id"] == "q1"
+    assert _parse_json(raw)["type"] == "sql"        # single-question path takes the object
+
 def test_parse_json_raises_on_garbage():
     with pytest.raises(Exception):
         _parse_json("not json at all")
@@ -114,10 +151,53 @@ def test_schema_text_contains_all_tables(conn):
     for t in ["customers", "categories", "products", "orders", "order_items"]:
         assert t in schema
 
+def test_schema_text_is_cached_until_invalidated(conn):
+    """run_question keeps the schema its app was built with; invalidate_schema picks up DDL changes."""
+    llm = FakeLLM([sql_resp("SELECT name FROM customers")])
+    run_question(conn=conn, llm=llm, question="q")
+    conn.execute("CREATE TABLE coupons (code TEXT)")
+    run_question(conn=conn, llm=llm, question="q")
+    assert "coupons" not in llm.sql_calls[-1]         # cached app, build-time schema
+    invalidate_schema(conn)
+    run_question(conn=conn, llm=llm, question="q")
+    assert "CREATE TABLE coupons" in llm.sql_calls[-1]
+
 def test_sql_prompt_includes_repair_on_error():
     p = _sql_prompt("q", "schema", last_error="no such table: foo")
     assert "no such table: foo" in p and "Fix it" in p
 
+def test_sql_prompts_share_a_stable_prefix(conn):
+    """Instructions + schema come first and are byte-identical across questions (prompt caching)."""
+    llm = FakeLLM([sql_resp("SELECT name FROM customers")])
+    app = build_app(conn=conn, llm=llm)
+    run_with_app(app, "first question")
+    run_with_app(app, "second question")
+    head_1, q_1 = llm.sql_calls[0].split("User question: ")
+    head_2, q_2 = llm.sql_calls[1].split("User question: ")
+    assert head_1 == head_2 and head_1.endswith(_schema_text(conn) + "\n")
+    assert (q_1, q_2) == ("first question", "second question")
+
+def test_answer_prompt_embeds_result_as_json():
+    p = _answer_prompt("q", "SELECT 1", ["n", "name"], [[1, "Tel Aviv"]])
+    result = json.loads(p.split("Result: ", 1)[1])
+    assert result == {"columns": ["n", "name"], "rows": [[1, "Tel Aviv"]]}
+
+def test_dumps_matches_stdlib_json_semantics():
+    """orjson (when installed) and the json fallback agree on content, incl. non-str keys."""
+    obj = {"rows": [(1, "Tel Aviv", None)], 2: 3.5}
+    assert json.loads(_dumps(obj)) == json.loads(json.dumps(obj))
+    assert _dumps({"b": 1, "a": [2]}, sort_keys=True).replace(" ", "") == '{"a":[2],"b":1}'
+    assert json.loads(_dumps(obj, indent=True)) == json.loads(json.dumps(obj))
+
+def test_answer_prompt_truncates_large_results():
+    """Only preview_rows rows reach the prompt; the rest are summarized by count and min/max."""
+    rows = [(i, f"name{i}", None) for i in range(1, 26)]
+    p = _answer_prompt("q", "SELECT 1", ["id", "name", "note"], rows, preview_rows=5)
+    result = json.loads(p.split("Result: ", 1)[1])
+    assert len(result["rows"]) == 5 and result["n_total"] == 25
+    assert "20 more rows truncated" in result["truncated"]
+    assert result["aggregates"] == {"id": {"min": 1, "max": 25}}  # numeric columns only
+
 def test_gen_sql_passes_structured_output_schema(conn):
     """SQL-generation calls must request the strict structured-output schema."""
     llm = FakeLLM([sql_resp("SELECT name FROM customers")])
@@ -126,6 +206,34 @@ def test_gen_sql_passes_structured_output_schema(conn):
     assert llm.schemas[0]["strict"] is True
     assert llm.schemas[0]["name"] == "sql_decision"
 
+def test_openai_llm_memoizes_identical_prompts(monkeypatch):
+    """Identical (prompt, schema) pairs hit the OpenAI API once; cache_clear() resets."""
+    calls = []
+    class FakeCompletions:
+        def create(self, **kw):
+            calls.append(kw)
+            msg = type("M", (), {"content": f"reply {len(calls)}"})
+            return type("R", (), {"choices": [type("C", (), {"message": msg})]})
+    class FakeOpenAI:
+        chat = type("Chat", (), {"completions": FakeCompletions()})
+        def __init__(self, **kw):
+            self.kw = kw
+
+    monkeypatch.setattr("qa_agent.OpenAI", FakeOpenAI)
+    llm = make_openai_llm()
+    assert llm("p", response_schema=SQL_DECISION_SCHEMA) == llm("p", response_schema=SQL_DECISION_SCHEMA)
+    assert llm("p") == "reply 2"                     # different schema → different entry
+    assert calls[0]["response_format"]["json_schema"] is SQL_DECISION_SCHEMA
+    llm.cache_clear()
+    assert llm("p") == "reply 3" and len(calls) == 3
+
+def test_openai_clients_share_pooled_http_settings(monkeypatch):
+    monkeypatch.setenv("OPENAI_MAX_RETRIES", "5")
+    kw = _openai_client_kwargs()
+    assert kw["max_retries"] == 5
+    assert kw["http_client"].timeout.read == 30.0
+    kw["http_client"].close()
+
 def test_gen_sql_rejects_non_select_and_retries(conn):
     """DELETE must be rejected; agent should retry and succeed with valid SELECT."""
     llm = FakeLLM([
@@ -136,6 +244,9 @@ def test_gen_sql_rejects_non_select_and_retries(conn):
         {"question": "q", "trace": [], "attempts": 0, "clarifications": 0}, config=CFG
     )
     assert out.get("rows") is not None
+    # the rejected SQL never reaches exec_sql: one execution, for the repaired query
+    assert [e["node"] for e in out["trace"]].count("exec_sql") == 1
+    assert "Only SELECT allowed." in llm.sql_calls[1]
 
 def test_gen_sql_appends_limit_when_missing(conn):
     llm = FakeLLM([sql_resp("SELECT name FROM customers")])
@@ -145,6 +256,15 @@ def test_gen_sql_appends_limit_when_missing(conn):
     assert "limit" in out["sql"].lower()
 
 
+def test_check_sql_limit_detection():
+    """Only a trailing LIMIT clause counts — not identifiers, literals or subqueries."""
+    assert _check_sql("SELECT 1 LIMIT 5", 50) == ("SELECT 1 LIMIT 5", "")
+    assert _check_sql("select * from t limit 5 offset 10;", 50)[0].endswith("offset 10")
+    assert _check_sql("SELECT limit_reached FROM t", 50)[0].endswith("LIMIT 50")
+    assert _check_sql("SELECT * FROM t WHERE note = 'no limit 1'", 50)[0].endswith("LIMIT 50")
+    assert _check_sql("SELECTED", 50) == ("", "Only SELECT allowed.")
+
+
 # ── 3. End-to-end agent behavior ───────────────────────────────────────────────
 
 def test_e2e_happy_path(conn):
@@ -156,9 +276,49 @@ def test_e2e_happy_path(conn):
         answer="Alice Cohen placed order #1.",
     )
     ans, trace, state = run_question(conn=conn, llm=llm, question="Who placed order 1?")
-    assert state["rows"]
+    assert state["rows"][0][0] == "Alice Cohen" and state["columns"] == ["name"]
     assert isinstance(ans, str) and len(ans) > 0
 
+def test_e2e_columns_follow_ddl_changes(conn):
+    """Column names are read per execution, so the same SQL after ALTER TABLE stays aligned."""
+    conn.execute("CREATE TABLE coupons (code TEXT)")
+    conn.execute("INSERT INTO coupons VALUES ('X')")
+    app = build_app(conn=conn, llm=FakeLLM([sql_resp("SELECT * FROM coupons")]))
+    assert run_with_app(app, "q")[2]["columns"] == ["code"]
+    conn.execute("ALTER TABLE coupons ADD COLUMN pct INTEGER DEFAULT 5")
+    state = run_with_app(app, "q")[2]
+    assert state["columns"] == ["code", "pct"] and state["rows"] == [("X", 5)]
+
+def test_e2e_row_factory_rows_become_tuples(conn):
+    """A connection using sqlite3.Row still yields plain, JSON-serializable tuples."""
+    conn.row_factory = sqlite3.Row
+    llm = FakeLLM([sql_resp("SELECT name, country FROM customers WHERE customer_id = 1")])
+    _, _, state = run_question(conn=conn, llm=llm, question="q")
+    assert state["rows"] == [("Alice Cohen", "Israel")]
+    assert state["columns"] == ["name", "country"]
+    assert '"Alice Cohen"' in llm.answer_calls[0]
+
+def test_e2e_shared_cursor_lives_as_long_as_the_app(conn):
+    """exec_sql reuses one cursor across runs (and after errors); disposing the app closes it."""
+    class RecordingConn:
+        def __init__(self, db):
+            self.db, self.cursors = db, []
+        def cursor(self):
+            self.cursors.append(self.db.cursor())
+            return self.cursors[-1]
+
+    rc = RecordingConn(conn)
+    llm = FakeLLM([sql_resp("SELECT * FROM fake_table"), sql_resp("SELECT name FROM customers")])
+    app = build_app(conn=rc, llm=llm)
+    n_cursors = len(rc.cursors)
+    for q in ("a", "b"):
+        assert run_with_app(app, q)[2]["rows"]
+    assert len(rc.cursors) == n_cursors        # no new cursor per query or retry
+    del app
+    gc.collect()
+    with pytest.raises(sqlite3.ProgrammingError):
+        rc.cursors[-1].execute("SELECT 1")      # closed together with the app
+
 def test_e2e_retry_passes_error_to_llm(conn):
     """On DB error, the retry prompt must include the original error message."""
     llm = FakeLLM([
@@ -174,6 +334,75 @@ def test_e2e_retries_exhausted_returns_error_message(conn):
     ans, _, _ = run_question(conn=conn, llm=llm, question="q", config=AgentConfig(max_attempts=1))
     assert "Couldn't run a valid SQL query" in ans
 
+def test_e2e_reuses_compiled_app(conn):
+    """run_question compiles the graph once per (conn, llm, config); run_with_app takes a prebuilt one."""
+    llm = FakeLLM([sql_resp("SELECT name FROM customers")], answer="Names.")
+    _, t1, _ = run_question(conn=conn, llm=llm, question="q1")
+    hits = _cached_app.cache_info().hits
+    _, t2, _ = run_question(conn=conn, llm=llm, question="q2")
+    assert _cached_app.cache_info().hits == hits + 1      # second call reused the graph
+    assert t1 is not t2 and len(llm.sql_calls) == 2       # ...with independent runs
+    app = build_app(conn=conn, llm=llm)
+    assert [run_with_app(app, q)[0] for q in ("a", "b")] == ["Names.", "Names."]
+
+def test_e2e_unhashable_llm_gets_an_uncached_app(conn):
+    """An LLM that can't be hashed (e.g. a plain @dataclass) still works, just without caching."""
+    class UnhashableLLM(FakeLLM):
+        __hash__ = None
+    llm = UnhashableLLM([sql_resp("SELECT name FROM customers")], answer="Names.")
+    assert run_question(conn=conn, llm=llm, question="q")[0] == "Names."
+    batch = run_questions_batch(conn=conn, llm=llm, questions=["a?"])  # falls back to single mode
+    assert [ans for ans, _, _ in batch] == ["Names."]
+
+def test_e2e_reused_thread_id_starts_a_fresh_run(conn):
+    """A caller-supplied thread_id keeps its checkpoint, but none of it leaks into the next run."""
+    llm = FakeLLM([sql_resp("SELECT * FROM nope")])
+    app = build_app(conn=conn, llm=llm, config=AgentConfig(max_attempts=1))
+    run_with_app(app, "q1", thread_id="user-1")
+    llm._queue = [sql_resp("SELECT name FROM customers")]
+    ans, _, state = run_with_app(app, "q2", thread_id="user-1")
+    assert "Previous SQL failed" not in llm.sql_calls[-1]
+    assert ans == "Answer." and state["last_error"] == "" and "customers" in state["sql"]
+
+def test_e2e_cached_app_does_not_accumulate_checkpoints(conn):
+    """run_question's shared app drops each run's checkpoints, even for a caller's thread_id."""
+    llm = FakeLLM([sql_resp("SELECT name FROM customers")])
+    for i in range(6):
+        run_question(conn=conn, llm=llm, question="q", thread_id=f"user-{i % 2}")
+    assert not _cached_app(conn, llm, None, None).checkpointer.storage
+    app = build_app(conn=conn, llm=llm)                    # a caller's own app keeps its threads
+    run_with_app(app, "q", thread_id="user-1")
+    assert list(app.checkpointer.storage) == ["user-1"]
+
+def test_e2e_single_row_answer_uses_template(conn):
+    """A single-row result fills the SQL call's answer_template — no second LLM call."""
+    llm = FakeLLM([sql_resp(
+        "SELECT COUNT(*) AS n FROM orders o JOIN customers c ON c.customer_id = o.customer_id "
+        "WHERE c.name = 'Alice Cohen'", template="Alice Cohen has placed {n} orders.")])
+    ans, trace, _ = run_question(conn=conn, llm=llm, question="How many orders has Alice placed?")
+    assert ans == "Alice Cohen has placed 3 orders."
+    assert not llm.answer_calls
+    assert any(e["node"] == "answer" and e["data"]["mode"] == "template" for e in trace)
+
+def test_e2e_multi_row_answer_ignores_template(conn):
+    llm = FakeLLM([sql_resp("SELECT name FROM customers", template="The customer is {name}.")],
+                  answer="All customers.")
+    ans, _, _ = run_question(conn=conn, llm=llm, question="q")
+    assert ans == "All customers." and len(llm.answer_calls) == 1
+
+def test_render_answer_template_rejects_unknown_or_null_placeholders():
+    assert _render_answer_template("{total}", ["total"], [(None,)]) is None
+    assert _render_answer_template("{x.__class__}", ["x"], [(1,)]) is None
+    assert _render_answer_template("{other}", ["total"], [(5,)]) is None
+    assert _render_answer_template("Total: {total}", ["total"], [(5,)]) == "Total: 5"
+
+def test_render_answer_template_rounds_floats():
+    """AVG and friends come back as floats — answers show at most two decimals."""
+    render = lambda v: _render_answer_template("Avg is {avg}.", ["avg"], [(v,)])
+    assert render(200 / 3) == "Avg is 66.67."
+    assert render(5.0) == "Avg is 5." and render(1234.5) == "Avg is 1234.5."
+    assert render(-0.001) == "Avg is 0."
+
 def test_e2e_trace_contains_key_nodes(conn):
     """Trace must record load_schema, gen_sql, exec_sql, and answer nodes."""
     llm = FakeLLM([sql_resp("SELECT name FROM customers")])
@@ -182,6 +411,35 @@ def test_e2e_trace_contains_key_nodes(conn):
     assert {"load_schema", "gen_sql", "exec_sql", "answer"}.issubset(nodes)
 
 
+def test_trace_keeps_raw_llm_output_only_when_verbose(conn):
+    raw = sql_resp("SELECT name FROM customers")
+    _, trace, _ = run_question(conn=conn, llm=FakeLLM([raw]), question="q")
+    assert next(e for e in trace if e["node"] == "llm_raw")["data"]["raw"] == f"<{len(raw)} chars>"
+    _, trace, _ = run_question(conn=conn, llm=FakeLLM([raw]), question="q",
+                               config=AgentConfig(trace_verbose=True))
+    assert next(e for e in trace if e["node"] == "llm_raw")["data"]["raw"] == raw
+
+    assert all(isinstance(e["ts_ms"], int) for e in trace)      # verbose: wall-clock too
+
+    buf = io.StringIO()
+    write_trace(trace, buf)
+    assert buf.getvalue() == format_trace(trace) + "\n"
+
+def test_refusal_none_response_is_retried(conn):
+    """A structured-output refusal (content None) goes through the retry loop instead of crashing."""
+    llm = FakeLLM([None, sql_resp("SELECT name FROM customers")], answer="Names.")
+    ans, trace, _ = run_question(conn=conn, llm=llm, question="q", config=AgentConfig(max_attempts=2))
+    assert ans == "Names." and len(llm.sql_calls) == 2
+    assert next(e for e in trace if e["node"] == "llm_raw")["data"]["raw"] == "<0 chars>"
+
+def test_trace_times_are_relative_to_run_start(conn):
+    _, trace, _ = run_question(conn=conn, llm=FakeLLM([sql_resp("SELECT 1")]), question="q")
+    deltas = [e["dt_ms"] for e in trace]
+    assert deltas == sorted(deltas) and deltas[0] >= 0
+    assert all("ts_ms" not in e for e in trace)
+    assert format_trace(trace).startswith(f"[+{deltas[0]}ms] load_schema")
+
+
 # ── 4. Human-in-the-loop clarification ─────────────────────────────────────────
 
 def test_clarify_interrupts_without_callback(conn):
@@ -189,7 +447,7 @@ def test_clarify_interrupts_without_callback(conn):
     llm = FakeLLM([clarify_resp("Which category?")])
     ans, _, out = run_question(conn=conn, llm=llm, question="Tell me about products")
     assert "Which category?" in ans
-    assert out.get("rows") is None
+    assert out["rows"] == [] and out["sql"] == ""
 
 def test_clarify_resumes_with_callback(conn):
     """
@@ -287,3 +545,98 @@ def test_schema_rag_puts_only_relevant_table_in_prompt(conn):
     assert "CREATE TABLE customers" not in prompt   # irrelevant table excluded
     assert any(e["node"] == "load_schema" and e["data"].get("mode") == "retrieval"
                for e in trace)                      # trace shows retrieval mode
+
+
+# ── 6. Batched questions ───────────────────────────────────────────────────────
+
+class BatchFakeLLM(FakeLLM):
+    """FakeLLM that also answers the batch prompts, recording every call it receives."""
+    def __init__(self, sql_items, answers, **kw):
+        super().__init__([sql_resp("SELECT name FROM customers")], **kw)
+        self._sql_items, self._answers = sql_items, answers
+        self.batch_calls = []
+
+    def __call__(self, prompt, *, response_schema=None):
+        if response_schema is SQL_BATCH_SCHEMA:
+            self.batch_calls.append(prompt)
+            return self._sql_items
+        if response_schema is ANSWER_BATCH_SCHEMA:
+            self.batch_calls.append(prompt)
+            return self._answers
+        return super().__call__(prompt, response_schema=response_schema)
+
+
+def test_sql_prompt_batch_labels_questions():
+    p = _sql_prompt_batch(["first?", "second?"], "CREATE TABLE t (id INT);")
+    assert "q1: first?" in p and "q2: second?" in p and p.count("CREATE TABLE t") == 1
+
+
+def test_batch_answers_all_questions_in_two_calls(conn):
+    """n questions → one SQL-gen call + one answer call, answers aligned by label."""
+    llm = BatchFakeLLM(
+        _dumps({"type": "batch", "items": [
+            {"id": "q2", "type": "sql", "sql": "SELECT COUNT(*) FROM orders", "question": None},
+            {"id": "q1", "type": "sql", "sql": "SELECT name FROM customers", "question": None},
+        ]}),
+        _dumps({"items": [{"id": "q1", "answer": "Names."}, {"id": "q2", "answer": "Count."}]}),
+    )
+    results = run_questions_batch(conn=conn, llm=llm, questions=["names?", "count?"])
+    assert [ans for ans, _, _ in results] == ["Names.", "Count."]
+    assert results[1][2]["rows"] and "LIMIT" in results[1][2]["sql"]
+    assert len(llm.batch_calls) == 2 and not llm.sql_calls   # no per-question calls
+    hits = _cached_batch_app.cache_info().hits
+    run_questions_batch(conn=conn, llm=llm, questions=["names?", "count?"])
+    assert _cached_batch_app.cache_info().hits == hits + 1   # batch graph compiled once
+
+
+def test_batch_falls_back_to_single_mode(conn):
+    """Unparseable batch output → every question reruns through the single-question graph."""
+    llm = BatchFakeLLM("not json", "not json", answer="Single.")
+    results = run_questions_batch(conn=conn, llm=llm, questions=["a?", "b?"])
+    assert [ans for ans, _, _ in results] == ["Single.", "Single."]
+    assert len(llm.sql_calls) == 2
+
+
+def test_batch_rejects_async_llm(conn):
+    """The batch graph is sync — an async LLM fails fast instead of returning coroutines."""
+    async def llm(prompt, *, response_schema=None):
+        return ""
+    with pytest.raises(TypeError, match="run_questions_async"):
+        run_questions_batch(conn=conn, llm=llm, questions=["a?"])
+
+
+# ── 7. Async / concurrent questions ────────────────────────────────────────────
+
+class AsyncFakeLLM(FakeLLM):
+    """FakeLLM with an async __call__, like make_openai_llm_async. Records the call order."""
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.calls = []  # "sql" / "answer", in the order the calls were made
+
+    async def __call__(self, prompt, *, response_schema=None):
+        self.calls.append("sql" if response_schema is SQL_DECISION_SCHEMA else "answer")
+        await asyncio.sleep(0.02)  # a network round-trip, so concurrent questions interleave
+        return FakeLLM.__call__(self, prompt, response_schema=response_schema)
+
+
+def test_async_questions_run_concurrently(conn):
+    """Each question gets its own run; SQL executes on the connection's own thread."""
+    llm = AsyncFakeLLM([sql_resp("SELECT name FROM customers")], answer="Names.")
+    results = asyncio.run(run_questions_async(conn=conn, llm=llm, questions=["a", "b", "c"]))
+    assert [ans for ans, _, _ in results] == ["Names."] * 3
+    assert all(state["rows"] for _, _, state in results)
+    assert [state["question"] for _, _, state in results] == ["a", "b", "c"]
+    assert llm.calls == ["sql"] * 3 + ["answer"] * 3   # interleaved, not one question at a time
+
+
+def test_async_clarify_resumes_with_callback(conn):
+    llm = AsyncFakeLLM(
+        [clarify_resp("Which category?"), sql_resp("SELECT name FROM customers")],
+        answer="Here are the customers.",
+    )
+    async def on_clarify(q):
+        return "Electronics"
+
+    [(ans, trace, state)] = asyncio.run(run_questions_async(
+        conn=conn, llm=llm, questions=["Tell me about products"], on_clarify=on_clarify))
+    assert ans == "Here are the customers." and "Electronics" in state["question"]